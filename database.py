@@ -5,7 +5,10 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -15,18 +18,21 @@ from pydantic import BaseModel
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 _client = None
 db = None
+_user_email_indexed = False
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url)
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,16 +46,50 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None,
+                        projection: dict = None, sort: list = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
+
+async def get_document(collection_name: str, filter_dict: dict):
+    """Get a single document from collection, or None"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return await db[collection_name].find_one(filter_dict)
+
+def user_email_index_ready() -> bool:
+    """Whether the unique index on user.email is known to exist"""
+    return _user_email_indexed
+
+async def ensure_indexes():
+    """Create the indexes the API relies on (idempotent); failures are logged, not raised"""
+    global _user_email_indexed
+    if db is None:
+        return
+
+    try:
+        await db["user"].create_index("email", unique=True)
+        _user_email_indexed = True
+    except PyMongoError:
+        logger.exception("Could not create unique index on user.email")
+    try:
+        await db["flightplan"].create_index([("user_id", 1), ("departure_time", -1)])
+    except PyMongoError:
+        logger.exception("Could not create index on flightplan (user_id, departure_time)")
+    try:
+        await db["briefing"].create_index("flight_plan_id")
+    except PyMongoError:
+        logger.exception("Could not create index on briefing.flight_plan_id")
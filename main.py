@@ -1,31 +1,74 @@
+import hashlib
+import hmac
 import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Optional
 
-from fastapi import FastAPI, HTTPException, Depends
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, EmailStr
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, EmailStr, field_validator
 from passlib.context import CryptContext
-from jose import jwt, JWTError
+import jwt
+from jwt import InvalidTokenError as JWTError
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
 
-from database import create_document, get_documents, db
+from database import create_document, get_document, get_documents, ensure_indexes, user_email_index_ready, db
 from schemas import User, FlightPlan, Briefing
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 12
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 10))
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "https://app.weathaware.com").split(",") if o.strip()]
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS, deprecated="auto")
+# Verified against when the email is unknown so login timing doesn't reveal it
+_DUMMY_HASH = pwd_context.hash("x" * 16)
+# Successful (email, password) checks, so quick repeat logins skip bcrypt
+_verified_logins: TTLCache = TTLCache(maxsize=1024, ttl=60)
+# Token digest -> (user, exp), so repeat requests skip the JWT decode and user lookup
+_token_users: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+# (user id, flight plan id) -> serialized /brief response
+_briefings: TTLCache = TTLCache(maxsize=2048, ttl=600)
+# Serialized /test body from the last successful database check
+_test_body: TTLCache = TTLCache(maxsize=1, ttl=10)
+# First ten collection names, so health probes don't each hit Mongo
+_collection_names: TTLCache = TTLCache(maxsize=1, ttl=30)
 
-app = FastAPI(title="WeathAware API")
+_ROOT_RESPONSE = Response(content=orjson.dumps({"message": "WeathAware API running"}), media_type="application/json")
+
+# Only the fields the dashboard renders for recent plans
+DASHBOARD_PLAN_FIELDS = {"_id": 1, "callsign": 1, "origin": 1, "destination": 1, "departure_time": 1}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    yield
+
+
+app = FastAPI(title="WeathAware API", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,
 )
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
 
 
 class Token(BaseModel):
@@ -48,12 +91,21 @@ class FlightPlanIn(BaseModel):
     callsign: Optional[str] = None
     origin: str = Field(..., min_length=3, max_length=4)
     destination: str = Field(..., min_length=3, max_length=4)
-    alternates: list[str] = Field(default_factory=list)
+    alternates: list[Annotated[str, Field(min_length=3, max_length=4)]] = Field(default_factory=list)
     route: Optional[str] = None
     departure_time: datetime
     cruise_altitude: Optional[str] = None
     aircraft_type: Optional[str] = None
 
+    @field_validator("origin", "destination", "alternates", mode="before")
+    @classmethod
+    def uppercase_icao(cls, value):
+        if isinstance(value, str):
+            return value.upper()
+        if isinstance(value, list):
+            return [a.upper() if isinstance(a, str) else a for a in value]
+        return value
+
 
 class BriefingRequest(BaseModel):
     flight_plan_id: str
@@ -61,86 +113,122 @@ class BriefingRequest(BaseModel):
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
-    to_encode.update({"exp": datetime.utcnow().timestamp() + ACCESS_TOKEN_EXPIRE_MINUTES * 60})
+    to_encode["exp"] = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(token: str | None = None):
-    # In a real app, use OAuth2PasswordBearer; simplified here
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def verify_password(email: str, password: str, password_hash: str) -> bool:
+    # Key on an HMAC of the password, never the plaintext, plus the stored hash
+    digest = hmac.new(SECRET_KEY.encode(), password.encode(), hashlib.sha256).digest()
+    key = (email, password_hash, digest)
+    if key in _verified_logins:
+        return True
+    if not await run_in_threadpool(pwd_context.verify, password, password_hash):
+        return False
+    _verified_logins[key] = True
+    return True
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _token_users.get(key)
+    if cached is not None:
+        user, exp = cached
+        if exp > time.time():
+            return user
+        _token_users.pop(key, None)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        users = get_documents("user", {"email": email}, limit=1)
+        users = await get_documents("user", {"email": email}, limit=1)
         if not users:
             raise HTTPException(status_code=401, detail="User not found")
+        _token_users[key] = (users[0], payload.get("exp", 0))
         return users[0]
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
 @app.get("/")
-def root():
-    return {"message": "WeathAware API running"}
+async def root():
+    return _ROOT_RESPONSE
 
 
 @app.post("/auth/register", response_model=Token)
-def register(req: RegisterRequest):
-    existing = get_documents("user", {"email": req.email}, limit=1)
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = pwd_context.hash(req.password)
+async def register(req: RegisterRequest):
+    # Without the unique index, fall back to checking for the email first
+    if not user_email_index_ready():
+        if await get_documents("user", {"email": req.email}, limit=1):
+            raise HTTPException(status_code=400, detail="Email already registered")
+    hashed = await run_in_threadpool(pwd_context.hash, req.password)
     user = User(name=req.name, email=req.email, password_hash=hashed)
-    create_document("user", user)
+    try:
+        await create_document("user", user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     token = create_access_token({"sub": req.email})
     return Token(access_token=token)
 
 
-@app.post("/auth/login", response_model=Token)
-def login(req: AuthRequest):
-    users = get_documents("user", {"email": req.email}, limit=1)
+async def authenticate(email: str, password: str) -> Token:
+    users = await get_documents("user", {"email": email}, limit=1)
     if not users:
+        await run_in_threadpool(pwd_context.verify, password, _DUMMY_HASH)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     user = users[0]
-    if not pwd_context.verify(req.password, user.get("password_hash", "")):
+    if not await verify_password(email, password, user.get("password_hash", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = create_access_token({"sub": req.email})
+    token = create_access_token({"sub": email})
     return Token(access_token=token)
 
 
-@app.post("/flightplan", response_model=dict)
-def create_flight_plan(fp: FlightPlanIn, token: str):
-    user = get_current_user(token)
-    doc = FlightPlan(
-        user_id=str(user.get("_id")),
-        callsign=fp.callsign,
-        origin=fp.origin.upper(),
-        destination=fp.destination.upper(),
-        alternates=[a.upper() for a in fp.alternates],
-        route=fp.route,
-        departure_time=fp.departure_time,
-        cruise_altitude=fp.cruise_altitude,
-        aircraft_type=fp.aircraft_type,
-    )
-    inserted_id = create_document("flightplan", doc)
+@app.post("/auth/login", response_model=Token)
+async def login(req: AuthRequest):
+    return await authenticate(req.email, req.password)
+
+
+@app.post("/auth/token", response_model=Token)
+async def login_form(form: OAuth2PasswordRequestForm = Depends()):
+    # OAuth2 password flow (form-encoded, email as username) used by the docs "Authorize" button
+    return await authenticate(form.username, form.password)
+
+
+@app.post("/flightplan")
+async def create_flight_plan(fp: FlightPlanIn, user: dict = Depends(get_current_user)):
+    # fp is already validated and normalized, so skip a second validation pass
+    doc = FlightPlan.model_construct(user_id=str(user.get("_id")), **fp.model_dump())
+    inserted_id = await create_document("flightplan", doc)
     return {"id": inserted_id}
 
 
-@app.get("/dashboard", response_model=dict)
-def dashboard(token: str):
-    user = get_current_user(token)
-    plans = get_documents("flightplan", {"user_id": str(user.get("_id"))}, limit=20)
+@app.get("/dashboard")
+async def dashboard(user: dict = Depends(get_current_user)):
+    plans = await get_documents(
+        "flightplan",
+        {"user_id": str(user.get("_id"))},
+        limit=20,
+        projection=DASHBOARD_PLAN_FIELDS,
+        sort=[("departure_time", -1)],
+    )
+    for plan in plans:
+        plan["_id"] = str(plan["_id"])
     return {"user": {"name": user.get("name"), "email": user.get("email")}, "recent_plans": plans}
 
 
-@app.post("/brief", response_model=dict)
-def generate_briefing(req: BriefingRequest, token: str):
-    user = get_current_user(token)
-    plans = get_documents("flightplan", {"_id": {"$eq": db["flightplan"]._ensure_objectid(req.flight_plan_id)}})
-    plan = plans[0] if plans else None
+@app.post("/brief")
+async def generate_briefing(req: BriefingRequest, user: dict = Depends(get_current_user)):
+    cache_key = (str(user.get("_id")), req.flight_plan_id)
+    cached = _briefings.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    try:
+        oid = ObjectId(req.flight_plan_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid flight plan id")
+    plan = await get_document("flightplan", {"_id": oid})
     if not plan:
         raise HTTPException(status_code=404, detail="Flight plan not found")
 
@@ -149,13 +237,14 @@ def generate_briefing(req: BriefingRequest, token: str):
         "Winds aloft moderate, isolated TS enroute, bases 3k ft, "
         "VFR marginal near destination after 21Z; fuel/alt review advised."
     )
+    risk_level = "MEDIUM"
 
     briefing = Briefing(
         user_id=str(user.get("_id")),
         flight_plan_id=req.flight_plan_id,
         summary=summary,
         hazards=[{"type": "TS", "severity": "MOD", "location": "enroute"}],
-        risk_level="MEDIUM",
+        risk_level=risk_level,
         metar={"origin": "METAR KJFK 121651Z ..."},
         taf={"destination": "TAF KLAX 121720Z ..."},
         notams=[{"id": "A1234", "text": "RWY 12/30 closed"}],
@@ -164,12 +253,26 @@ def generate_briefing(req: BriefingRequest, token: str):
         overlays={"route": {"type": "LineString", "coordinates": []}},
     )
 
-    inserted_id = create_document("briefing", briefing)
-    return {"id": inserted_id, "summary": briefing.summary, "risk": briefing.risk_level}
+    inserted_id = await create_document("briefing", briefing)
+    body = orjson.dumps({"id": inserted_id, "summary": summary, "risk": risk_level})
+    _briefings[cache_key] = body
+    return Response(content=body, media_type="application/json")
+
+
+async def list_collections() -> list[str]:
+    names = _collection_names.get("names")
+    if names is None:
+        names = (await db.list_collection_names())[:10]
+        _collection_names["names"] = names
+    return names
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
+    cached = _test_body.get("body")
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -186,8 +289,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                response["collections"] = await list_collections()
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
@@ -198,10 +300,13 @@ def test_database():
 
     response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
     response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
-    return response
+    body = orjson.dumps(response)
+    if response["database"] == "✅ Connected & Working":
+        _test_body["body"] = body
+    return Response(content=body, media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=port, loop="uvloop", http="httptools", access_log=False)
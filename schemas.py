@@ -3,8 +3,9 @@ Database Schemas for WeathAware
 
 Each Pydantic model represents a MongoDB collection. The collection name is the lowercase
 of the class name (e.g., User -> "user").
+Hazard, Notam, Pirep and AlternateAirport are subdocuments embedded in a Briefing.
 """
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field, EmailStr
 from datetime import datetime
 
@@ -26,16 +27,33 @@ class FlightPlan(BaseModel):
     cruise_altitude: Optional[str] = None
     aircraft_type: Optional[str] = None
 
+class Hazard(BaseModel):
+    type: str
+    severity: str
+    location: str
+
+class Notam(BaseModel):
+    id: str
+    text: str
+
+class Pirep(BaseModel):
+    loc: str
+    wx: str
+
+class AlternateAirport(BaseModel):
+    icao: str
+    category: str
+
 class Briefing(BaseModel):
     user_id: str = Field(...)
     flight_plan_id: str = Field(...)
     summary: str = Field(..., description="AI 5-line summary")
-    hazards: List[dict] = Field(default_factory=list)
+    hazards: List[Hazard] = Field(default_factory=list)
     risk_level: str = Field("LOW", description="LOW/MEDIUM/HIGH")
-    metar: dict = Field(default_factory=dict)
-    taf: dict = Field(default_factory=dict)
-    notams: List[dict] = Field(default_factory=list)
-    pireps: List[dict] = Field(default_factory=list)
-    alternates: List[dict] = Field(default_factory=list)
-    overlays: dict = Field(default_factory=dict, description="GeoJSON overlays for map")
+    metar: Dict[str, str] = Field(default_factory=dict, description="Raw METAR keyed by airport role")
+    taf: Dict[str, str] = Field(default_factory=dict, description="Raw TAF keyed by airport role")
+    notams: List[Notam] = Field(default_factory=list)
+    pireps: List[Pirep] = Field(default_factory=list)
+    alternates: List[AlternateAirport] = Field(default_factory=list)
+    overlays: Dict[str, dict] = Field(default_factory=dict, description="GeoJSON overlays for map")
     created_at: Optional[datetime] = None